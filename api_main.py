@@ -2,11 +2,13 @@
 import logging
 import os
 import sys
+from typing import TYPE_CHECKING
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
 import uvicorn
-import json
+import anyio
+import orjson
+import functools
 
 # Add recommender_system to Python path
 # This assumes api_main.py is in the root of RAK_RECOMMENDER_PROJECT
@@ -14,8 +16,14 @@ import json
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__))))
 
 from recommender_system.data_loader import DataLoader
-from recommender_system.recommender import ProductRecommender
+if TYPE_CHECKING:
+    # Imported lazily in startup_event: it pulls in sentence-transformers/torch, which would
+    # otherwise be imported before uvicorn can bind the port (and once more in the parent process).
+    from recommender_system.recommender import ProductRecommender
 from recommender_system import config as sys_config # Import system's config
+from recommender_system.schemas import ( # Pydantic models for request body validation
+    ClientRequirements, RegionInfo, DeploymentInfo, ApplicationInfo, ConnectivityInfo
+)
 
 # --- Setup Logging ---
 logging.basicConfig(
@@ -50,15 +58,23 @@ app.add_middleware(
 
 # --- Global Initializations for Recommender ---
 # These variables will store the initialized instances or error messages.
-data_loader_instance = None
-recommender_instance = None
+data_loader_instance: "DataLoader | None" = None
+recommender_instance: "ProductRecommender | None" = None
 initialization_error_message = None
 
+# /recommend is a sync endpoint, so FastAPI runs it in anyio's worker thread pool.
+# Raise the pool size so concurrent CPU-bound requests don't queue behind the default limit.
+THREADPOOL_SIZE = int(os.environ.get("THREADPOOL_SIZE", 64))
+
 @app.on_event("startup")
 async def startup_event():
     global data_loader_instance, recommender_instance, initialization_error_message
     logger.info("FastAPI application startup: Initializing recommender...")
+    _recommend_cached.cache_clear()
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
     try:
+        from recommender_system.recommender import ProductRecommender # Heavy import, see TYPE_CHECKING block above
+
         # base_dir is the directory where api_main.py is located
         # e.g., C:\Users\Sibi\Desktop\rak_recommender_project
         base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -86,7 +102,7 @@ async def startup_event():
             mapping_file=mapping_file_path
         )
 
-        if not data_loader_instance.load_data():
+        if not await data_loader_instance.load_data():
             initialization_error_message = "Failed to load data via DataLoader."
         elif not data_loader_instance.preprocess_data():
             initialization_error_message = "Failed to preprocess data via DataLoader."
@@ -95,7 +111,10 @@ async def startup_event():
             if products_df is None or products_df.empty:
                 initialization_error_message = "Product data is empty after loading/preprocessing."
             else:
-                recommender_instance = ProductRecommender(products_df, features_df, product_feature_map_df)
+                recommender_instance = ProductRecommender(
+                    products_df, features_df, product_feature_map_df,
+                    indicators=data_loader_instance.get_indicators()
+                )
                 logger.info("Recommender initialized successfully for FastAPI app.")
         
         if initialization_error_message:
@@ -105,20 +124,39 @@ async def startup_event():
         initialization_error_message = f"Critical error during recommender initialization: {str(e)}"
         logger.error(initialization_error_message, exc_info=True)
 
-# Pydantic model for request body validation
-class ClientRequirements(BaseModel):
-    clientInfo: dict | None = None # Making these optional as per example JSON
-    region: dict | None = None
-    deployment: dict | None = None
-    application: dict | None = None
-    scale: str | None = None
-    connectivity: dict | None = None
-    power: list[str] | None = None
-    additionalDetails: str | None = None
-    # Add any other fields your frontend might send, ensuring types match
+# --- Recommendation Cache ---
+# Product data is static for the lifetime of the process, so identical requirements
+# always produce identical recommendations. The cache is only cleared on startup.
+RECOMMENDATION_CACHE_SIZE = 512
 
-@app.post("/recommend")
-async def get_recommendations_api(requirements: ClientRequirements):
+class _RequirementsKey:
+    """Hashable wrapper around a ClientRequirements model, keyed on what affects the ranking.
+
+    That is the normalized hard constraints (ParsedRequirements) plus the soft-match query
+    text, so fields the recommender ignores (clientInfo, scale, region.selected) and the
+    validated vs. model_construct'ed forms of the same payload share one cache entry.
+    """
+    __slots__ = ('requirements', 'key')
+
+    def __init__(self, requirements):
+        self.requirements = requirements
+        self.key = (
+            recommender_instance.hard_matcher.prepare(requirements),
+            recommender_instance.soft_matcher.build_requirement_query(requirements)
+        )
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __eq__(self, other):
+        return isinstance(other, _RequirementsKey) and self.key == other.key
+
+@functools.lru_cache(maxsize=RECOMMENDATION_CACHE_SIZE)
+def _recommend_cached(requirements_key, top_n):
+    # The returned list is shared between cache hits; treat it as read-only.
+    return recommender_instance.recommend(requirements_key.requirements, top_n=top_n)
+
+def _ensure_recommender_ready():
     # Global variables are read here; no 'global' keyword needed for reading.
     if initialization_error_message:
         logger.error(f"API call failed due to initialization error: {initialization_error_message}")
@@ -127,17 +165,19 @@ async def get_recommendations_api(requirements: ClientRequirements):
         logger.error("API call failed because recommender_instance is None.")
         raise HTTPException(status_code=503, detail="Recommender service is unavailable.")
 
+@app.post("/recommend")
+def get_recommendations_api(requirements: ClientRequirements):
+    _ensure_recommender_ready()
+
     try:
-        # Convert Pydantic model to dict. exclude_unset=True means fields not provided in JSON won't be in dict
-        client_requirements_json = requirements.model_dump(exclude_unset=True) 
-        
-        if not client_requirements_json: # Check if the resulting dict is empty
+        # The validated model is passed straight to the recommender; no dict round-trip.
+        if not requirements.model_fields_set: # No fields were provided in the JSON body
              logger.warning("Received empty requirements after Pydantic parsing.")
              raise HTTPException(status_code=400, detail="Empty or invalid requirements payload.")
 
-        logger.info(f"Received requirements for /recommend: {json.dumps(client_requirements_json, indent=2)}")
+        logger.info(f"Received requirements for /recommend: {requirements.model_dump_json(exclude_unset=True, indent=2)}")
         
-        recommendations = recommender_instance.recommend(client_requirements_json, top_n=3)
+        recommendations = _recommend_cached(_RequirementsKey(requirements), 3)
         logger.info(f"Generated {len(recommendations)} recommendations.")
         
         return recommendations
@@ -147,6 +187,80 @@ async def get_recommendations_api(requirements: ClientRequirements):
         logger.error(f"Error processing /recommend request: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+# --- Trusted Fast Path ---
+# For the internal frontend, whose payload shape is trusted: skips the full Pydantic
+# validation pass and only type-checks the fields the recommender actually reads.
+
+def _trusted_section(payload, key):
+    section = payload.get(key)
+    if section is not None and not isinstance(section, dict):
+        raise TypeError(f"'{key}' must be an object")
+    return section
+
+def _trusted_str(section, key):
+    value = section.get(key)
+    if value is not None and not isinstance(value, str):
+        raise TypeError(f"'{key}' must be a string")
+    return value
+
+def _trusted_str_list(section, key):
+    value = section.get(key)
+    if value is None:
+        return []
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise TypeError(f"'{key}' must be a list of strings")
+    return value
+
+def _parse_trusted_requirements(payload):
+    """Builds a ClientRequirements from a decoded JSON body via model_construct (no validation pass)."""
+    if not isinstance(payload, dict):
+        raise TypeError("Requirements payload must be a JSON object")
+    fields = {}
+    if (region := _trusted_section(payload, 'region')) is not None:
+        fields['region'] = RegionInfo.model_construct(frequencyBand=_trusted_str(region, 'frequencyBand'))
+    if (deployment := _trusted_section(payload, 'deployment')) is not None:
+        fields['deployment'] = DeploymentInfo.model_construct(environment=_trusted_str(deployment, 'environment'))
+    if (application := _trusted_section(payload, 'application')) is not None:
+        fields['application'] = ApplicationInfo.model_construct(
+            type=_trusted_str(application, 'type'),
+            subtypes=_trusted_str_list(application, 'subtypes'),
+            otherSubtype=_trusted_str(application, 'otherSubtype')
+        )
+    if (connectivity := _trusted_section(payload, 'connectivity')) is not None:
+        elaborate = _trusted_section(connectivity, 'elaborate') or {}
+        fields['connectivity'] = ConnectivityInfo.model_construct(
+            elaborate={category: _trusted_str_list(elaborate, category) for category in elaborate}
+        )
+    if 'power' in payload:
+        fields['power'] = _trusted_str_list(payload, 'power')
+    if 'additionalDetails' in payload:
+        fields['additionalDetails'] = _trusted_str(payload, 'additionalDetails')
+    return ClientRequirements.model_construct(**fields)
+
+@app.post("/recommend/fast")
+async def get_recommendations_fast_api(request: Request):
+    _ensure_recommender_ready()
+
+    try:
+        payload = orjson.loads(await request.body())
+        requirements = _parse_trusted_requirements(payload)
+    except (orjson.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+        logger.warning(f"Rejected /recommend/fast payload: {e}")
+        raise HTTPException(status_code=400, detail=f"Empty or invalid requirements payload: {e}")
+    # Same emptiness rule as /recommend's model_fields_set: any ClientRequirements field present,
+    # including ones the recommender does not read (e.g. clientInfo, scale)
+    if not payload.keys() & ClientRequirements.model_fields.keys():
+        raise HTTPException(status_code=400, detail="Empty or invalid requirements payload.")
+
+    try:
+        # CPU-bound; run it in the thread pool so the event loop stays free
+        recommendations = await anyio.to_thread.run_sync(_recommend_cached, _RequirementsKey(requirements), 3)
+        logger.info(f"Generated {len(recommendations)} recommendations (fast path).")
+        return recommendations
+    except Exception as e:
+        logger.error(f"Error processing /recommend/fast request: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 @app.get("/health")
 async def health_check():
     if initialization_error_message or not recommender_instance:
@@ -155,8 +269,12 @@ async def health_check():
 
 # To run locally (for testing Project 2 API standalone):
 # In your terminal, from RAK_RECOMMENDER_PROJECT root:
-# uvicorn api_main:app --reload --port 8001
+# uvicorn api_main:app --reload --port 8001  (--reload is for development only)
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8001)) # Railway will set PORT env var. Default to 8001 for local.
-    logger.info(f"Starting Uvicorn server directly on 0.0.0.0:{port} (for local testing via 'python api_main.py')...")
-    uvicorn.run("api_main:app", host="0.0.0.0", port=port, reload=True)
\ No newline at end of file
+    # Each worker runs startup_event and builds its own recommender_instance, so CPU-heavy
+    # recommend calls in one worker don't block requests served by the others.
+    workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+    loop = "uvloop" if sys.platform != "win32" else "asyncio" # uvloop is not available on Windows
+    logger.info(f"Starting Uvicorn server directly on 0.0.0.0:{port} with {workers} worker(s) (for local testing via 'python api_main.py')...")
+    uvicorn.run("api_main:app", host="0.0.0.0", port=port, loop=loop, http="httptools", workers=workers)
\ No newline at end of file
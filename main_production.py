@@ -1,5 +1,5 @@
 # main_production.py
-import json
+import orjson
 import logging
 import sys
 # Add the recommender_system directory to Python's path
@@ -36,7 +36,7 @@ if __name__ == "__main__":
         feature_file=sys_config.FEATURE_FILE,
         mapping_file=sys_config.MAPPING_FILE
     )
-    if not data_loader.load_data() or not data_loader.preprocess_data():
+    if not data_loader.load_data_sync() or not data_loader.preprocess_data():
         logger.error("Failed to initialize data. Exiting.")
         sys.exit(1)
     
@@ -50,7 +50,10 @@ if __name__ == "__main__":
     # This will also precompute embeddings, which might take a moment the first time
     # or if the model needs to be downloaded.
     try:
-        recommender = ProductRecommender(products_df, features_df, product_feature_map_df)
+        recommender = ProductRecommender(
+            products_df, features_df, product_feature_map_df,
+            indicators=data_loader.get_indicators()
+        )
         logger.info("ProductRecommender initialized successfully.")
     except Exception as e:
         logger.error(f"Failed to initialize ProductRecommender: {e}", exc_info=True)
@@ -119,10 +122,10 @@ if __name__ == "__main__":
 
     # --- Process the JSON Input ---
     try:
-        client_requirements_json = json.loads(json_input_string)
+        client_requirements_json = orjson.loads(json_input_string)
         logger.info("\n--- Parsed Client Requirements ---")
-        logger.info(json.dumps(client_requirements_json, indent=2))
-    except json.JSONDecodeError as e:
+        logger.info(orjson.dumps(client_requirements_json, option=orjson.OPT_INDENT_2).decode())
+    except orjson.JSONDecodeError as e:
         logger.error(f"Invalid JSON provided: {e}")
         logger.error("Please check the format of the JSON string you pasted.")
         sys.exit(1)
@@ -156,7 +159,7 @@ if __name__ == "__main__":
             "additionalDetails": "Small indoor tracker for assets using Bluetooth and WiFi."
         }
         logger.info("\n\n--- Generating Recommendations for Second Example (Indoor Tracker) ---")
-        logger.info(json.dumps(client_requirements_json_2, indent=2))
+        logger.info(orjson.dumps(client_requirements_json_2, option=orjson.OPT_INDENT_2).decode())
         recommendations_2 = recommender.recommend(client_requirements_json_2, top_n=3)
 
         logger.info("\n--- Top Recommendations (Indoor Tracker) ---")
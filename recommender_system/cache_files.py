@@ -0,0 +1,30 @@
+# recommender_system/cache_files.py
+import glob
+import os
+
+
+def write_cache_file(cache_path, write, stale_glob=None):
+    """Atomically writes a cache file, then removes older caches matching stale_glob.
+
+    write(path) must produce the file at the given path. It is called with a per-process
+    temp name that is renamed into place, so several workers building the same cache never
+    interleave writes and readers never see a partial file. Errors propagate to the caller
+    (after the temp file is removed); callers decide whether a failed write is fatal.
+    """
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if stale_glob:
+        for stale_path in glob.glob(stale_glob):
+            if stale_path != cache_path:
+                try:
+                    os.remove(stale_path)
+                except FileNotFoundError: # Already removed by another worker
+                    pass
@@ -4,6 +4,18 @@
 # Recommended: 'all-MiniLM-L6-v2' (good balance of speed and quality)
 # or 'paraphrase-multilingual-MiniLM-L12-v2' if multilingual product data
 SENTENCE_BERT_MODEL = 'all-MiniLM-L6-v2'
+ENCODE_BATCH_SIZE = 64
+# Batches larger than this are encoded with a multi-process pool (start_multi_process_pool);
+# below it, starting the workers and loading the model in each costs more than it saves
+MULTIPROCESS_THRESHOLD = 5000
+# Threads that encode requirement queries concurrently with hard-constraint filtering
+QUERY_ENCODE_WORKERS = 4
+# L2-normalize inside model.encode, so cosine similarity is a plain dot product downstream
+NORMALIZE_EMBEDDINGS = True
+# Storage precision of the normalized product embedding matrix: None (float32), 'fp16' or 'int8'.
+# This only shrinks the resident matrix (fp16: 1/2, int8: 1/4). Scoring is slower, not faster: each
+# query widens the candidate slice back to float32 for the BLAS matvec. Scores differ slightly.
+EMBEDDING_QUANTIZATION = None
 
 # --- Scoring Weights ---
 WEIGHTS = {
@@ -67,4 +79,18 @@ CONNECTIVITY_JSON_TO_PRODUCT_KEYWORDS = {
 # Assuming data files are in a 'data' subdirectory relative to where main_production.py is run
 PRODUCT_FILE = 'data/product_table.csv'
 FEATURE_FILE = 'data/feature_table.csv'
-MAPPING_FILE = 'data/mapping_table.csv'
\ No newline at end of file
+MAPPING_FILE = 'data/mapping_table.csv'
+
+# --- Preprocessed Data Cache ---
+# preprocess_data() results are pickled next to the CSVs and reused while the CSVs are unchanged.
+# Bump DATA_CACHE_VERSION whenever preprocessing changes so that old caches are not reused.
+DATA_CACHE_ENABLED = True
+DATA_CACHE_PREFIX = '_cache_'
+DATA_CACHE_VERSION = 5
+
+# --- Product Embedding Cache ---
+# Product embeddings are saved as cache/embeddings_<sha1>.npy, keyed on the model name and the
+# product corpora, so restarts with an unchanged catalog skip the SentenceTransformer encode.
+# Writing a new one removes the older embeddings_*.npy files in the directory.
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_DIR = 'cache'
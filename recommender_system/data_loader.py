@@ -1,10 +1,21 @@
 # recommender_system/data_loader.py
+import asyncio
+import hashlib
+import json
+import os
 import pandas as pd
 import logging
+from . import config # Use relative import
+from .cache_files import write_cache_file
+from .hard_matcher import build_indicator_matrices
 
 logger = logging.getLogger(__name__)
 
+
 class DataLoader:
+    # Separator for comma-separated list columns ('Region Support', 'Connectivity')
+    LIST_SPLIT_PATTERN = r'\s*,\s*'
+
     def __init__(self, product_file, feature_file, mapping_file):
         self.product_file = product_file
         self.feature_file = feature_file
@@ -12,13 +23,89 @@ class DataLoader:
         self.products_df = None
         self.features_df = None
         self.product_feature_map_df = None
-
-    def load_data(self):
-        """Loads data from CSV files into pandas DataFrames."""
+        self.region_indicator = None
+        self.connectivity_indicator = None
+        self.power_indicator = None
+        self.connectivity_mat = None # Bit-packed connectivity_indicator, see hard_matcher.pack_indicator
+        self.power_mat = None # Bit-packed power_indicator
+        self.loaded_from_cache = False
+
+    def _cache_path(self):
+        """Path of the preprocessed-data cache.
+
+        Keyed on the source CSVs' paths, mtimes and sizes, plus the config mappings and list
+        split pattern the cached indicators are built from, so editing those rebuilds the cache.
+        """
+        source_files = (self.product_file, self.feature_file, self.mapping_file)
+        preprocessing_inputs = json.dumps([
+            config.CONNECTIVITY_JSON_TO_PRODUCT_KEYWORDS, config.POWER_KEYWORD_MAPPING, self.LIST_SPLIT_PATTERN
+        ])
+        key_parts = [f"v{config.DATA_CACHE_VERSION}", preprocessing_inputs]
+        for path in source_files:
+            stat = os.stat(path)
+            key_parts.append(f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}")
+        key = hashlib.blake2b("|".join(key_parts).encode('utf-8'), digest_size=8).hexdigest()
+        cache_dir = os.path.dirname(os.path.abspath(self.product_file))
+        return os.path.join(cache_dir, f"{config.DATA_CACHE_PREFIX}{key}.pkl")
+
+    def _load_cache(self, cache_path):
+        cached = pd.read_pickle(cache_path)
+        self.products_df = cached['products_df']
+        self.features_df = cached['features_df']
+        self.product_feature_map_df = cached['product_feature_map_df']
+        self.region_indicator = cached['region_indicator']
+        self.connectivity_indicator = cached['connectivity_indicator']
+        self.power_indicator = cached['power_indicator']
+        self.connectivity_mat = cached['connectivity_mat']
+        self.power_mat = cached['power_mat']
+
+    def _save_cache(self):
+        """Pickles the preprocessed state and removes caches built from older versions of the CSVs."""
+        try:
+            cache_path = self._cache_path()
+            state = {
+                'products_df': self.products_df,
+                'features_df': self.features_df,
+                'product_feature_map_df': self.product_feature_map_df,
+                'region_indicator': self.region_indicator,
+                'connectivity_indicator': self.connectivity_indicator,
+                'power_indicator': self.power_indicator,
+                'connectivity_mat': self.connectivity_mat,
+                'power_mat': self.power_mat
+            }
+            write_cache_file(
+                cache_path,
+                lambda path: pd.to_pickle(state, path),
+                stale_glob=os.path.join(os.path.dirname(cache_path), f"{config.DATA_CACHE_PREFIX}*.pkl")
+            )
+            logger.info(f"Preprocessed data cached to {cache_path}.")
+        except Exception as e: # A read-only filesystem should not prevent startup
+            logger.warning(f"Could not write preprocessed data cache: {e}")
+
+    async def load_data(self):
+        """Loads data from CSV files into pandas DataFrames.
+
+        If a preprocessed cache for the current CSVs exists it is loaded instead, and
+        preprocess_data becomes a no-op. Otherwise the three files are independent, so
+        they are read concurrently in worker threads.
+        """
+        self.loaded_from_cache = False
         try:
-            self.products_df = pd.read_csv(self.product_file)
-            self.features_df = pd.read_csv(self.feature_file)
-            self.product_feature_map_df = pd.read_csv(self.mapping_file)
+            if config.DATA_CACHE_ENABLED:
+                cache_path = self._cache_path()
+                if os.path.exists(cache_path):
+                    try:
+                        await asyncio.to_thread(self._load_cache, cache_path)
+                        self.loaded_from_cache = True
+                        logger.info(f"Loaded preprocessed data from cache {cache_path}.")
+                        return True
+                    except Exception as e:
+                        logger.warning(f"Could not read preprocessed data cache, falling back to CSV: {e}")
+
+            self.products_df, self.features_df, self.product_feature_map_df = await asyncio.gather(
+                *(asyncio.to_thread(pd.read_csv, path)
+                  for path in (self.product_file, self.feature_file, self.mapping_file))
+            )
             logger.info("All data files loaded successfully.")
             return True
         except FileNotFoundError as e:
@@ -28,8 +115,25 @@ class DataLoader:
             logger.error(f"An unexpected error occurred during data loading: {e}")
             return False
 
+    def load_data_sync(self):
+        """Synchronous wrapper around load_data for callers without a running event loop."""
+        return asyncio.run(self.load_data())
+
+    @staticmethod
+    def _split_to_lower_list(series):
+        """Splits a comma-separated text column into lists of stripped, lowercased, non-empty items."""
+        return (
+            series.astype(str).str.strip().str.lower()
+            .str.split(DataLoader.LIST_SPLIT_PATTERN, regex=True)
+            .map(lambda items: [item for item in items if item])
+        )
+
     def preprocess_data(self):
         """Preprocesses the loaded data."""
+        if self.loaded_from_cache:
+            logger.info("Data already preprocessed (loaded from cache).")
+            return True
+
         if self.products_df is None or self.features_df is None or self.product_feature_map_df is None:
             logger.error("Data not loaded. Cannot preprocess.")
             return False
@@ -55,9 +159,7 @@ class DataLoader:
 
         # Normalize and split 'Region Support'
         if 'Region Support' in self.products_df.columns:
-            self.products_df['Region_Support_List'] = self.products_df['Region Support'].apply(
-                lambda x: [region.strip().lower() for region in str(x).split(',') if region.strip()]
-            )
+            self.products_df['Region_Support_List'] = self._split_to_lower_list(self.products_df['Region Support'])
         else:
             self.products_df['Region_Support_List'] = pd.Series([[] for _ in range(len(self.products_df))])
 
@@ -65,9 +167,7 @@ class DataLoader:
         # Normalize 'Connectivity' for keyword search AND list creation
         if 'Connectivity' in self.products_df.columns:
             self.products_df['Connectivity_Lower_Text'] = self.products_df['Connectivity'].str.lower()
-            self.products_df['Connectivity_List'] = self.products_df['Connectivity'].apply(
-                lambda x: [conn.strip().lower() for conn in str(x).split(',') if conn.strip()]
-            )
+            self.products_df['Connectivity_List'] = self._split_to_lower_list(self.products_df['Connectivity'])
         else:
             self.products_df['Connectivity_Lower_Text'] = ''
             self.products_df['Connectivity_List'] = pd.Series([[] for _ in range(len(self.products_df))])
@@ -78,6 +178,14 @@ class DataLoader:
             self.products_df['Deployment_Environment_Lower'] = self.products_df['Deployment_Environment'].str.lower()
         else:
              self.products_df['Deployment_Environment_Lower'] = ''
+        # Few distinct values: as a categorical, the per-request environment eq/isin masks compare int codes
+        self.products_df['Deployment_Environment_Lower'] = self.products_df['Deployment_Environment_Lower'].astype('category')
+
+
+        # Lowercased description + notes, searched for power keywords (built once, not per request)
+        self.products_df['Description_Notes_Lower_Text'] = (
+            self.products_df['Description_And_Application'].astype(str) + " " + self.products_df['Notes'].astype(str)
+        ).str.lower()
 
 
         # Ensure Product_ID is consistent for merging
@@ -86,8 +194,35 @@ class DataLoader:
         self.features_df['Feature_ID'] = self.features_df['Feature_ID'].astype(str)
         self.product_feature_map_df['Feature_ID'] = self.product_feature_map_df['Feature_ID'].astype(str)
 
+        # Boolean indicator matrices (one column per region / connectivity id / power label)
+        indicators = build_indicator_matrices(self.products_df)
+        self.region_indicator = indicators['region']
+        self.connectivity_indicator = indicators['connectivity']
+        self.power_indicator = indicators['power']
+        self.connectivity_mat = indicators['connectivity_mat']
+        self.power_mat = indicators['power_mat']
+
+        # Per-product frozenset of matched connectivity ids, for set intersection in check_constraints
+        conn_ids = self.connectivity_indicator.columns.to_numpy()
+        self.products_df['Connectivity_Canonical_Set'] = [
+            frozenset(conn_ids[row_mask]) for row_mask in self.connectivity_indicator.to_numpy()
+        ]
+
+        if config.DATA_CACHE_ENABLED:
+            self._save_cache()
+
         logger.info("Data preprocessing complete.")
         return True
 
     def get_data(self):
-        return self.products_df, self.features_df, self.product_feature_map_df
\ No newline at end of file
+        return self.products_df, self.features_df, self.product_feature_map_df
+
+    def get_indicators(self):
+        """Returns the indicator matrices built by preprocess_data, keyed by constraint."""
+        return {
+            'region': self.region_indicator,
+            'connectivity': self.connectivity_indicator,
+            'power': self.power_indicator,
+            'connectivity_mat': self.connectivity_mat,
+            'power_mat': self.power_mat
+        }
\ No newline at end of file
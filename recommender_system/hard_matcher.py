@@ -1,24 +1,232 @@
 # recommender_system/hard_matcher.py
 import re
 import logging
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
 from . import config # Use relative import
 
+try:
+    import ahocorasick # Optional (pyahocorasick): single-pass multi-keyword scanning
+except ImportError:
+    ahocorasick = None
+
 logger = logging.getLogger(__name__)
 
+
+def compile_keyword_regexes(keyword_mapping, whole_word=False):
+    """Compiles one alternation regex per mapping key (keys with no keywords are skipped).
+
+    Connectivity keywords are plain substring matches (e.g. 'lora' also matches 'lorawan'),
+    power keywords are matched as whole words.
+    """
+    regexes = {}
+    for key, keywords in keyword_mapping.items():
+        if not keywords:
+            continue
+        alternation = '|'.join(re.escape(kw) for kw in keywords)
+        regexes[key] = re.compile(r'\b(?:' + alternation + r')\b' if whole_word else alternation)
+    return regexes
+
+
+POWER_KEYWORD_REGEXES = compile_keyword_regexes(config.POWER_KEYWORD_MAPPING, whole_word=True)
+CONNECTIVITY_KEYWORD_REGEXES = compile_keyword_regexes(config.CONNECTIVITY_JSON_TO_PRODUCT_KEYWORDS)
+
+
+def _is_word_char(text, position):
+    return 0 <= position < len(text) and (text[position].isalnum() or text[position] == '_')
+
+
+class KeywordScanner:
+    """Finds which keys of a keyword mapping occur in a text.
+
+    With pyahocorasick installed, all keywords of all keys are matched in one pass over the
+    text with an Aho-Corasick automaton; otherwise each key's compiled alternation is searched.
+    Both report, per key, the leftmost keyword found (earliest-listed keyword on a tie),
+    i.e. the same keyword the key's regex would match.
+    """
+    def __init__(self, keyword_mapping, whole_word=False):
+        self.whole_word = whole_word
+        self._regexes = compile_keyword_regexes(keyword_mapping, whole_word=whole_word)
+        self._automaton = None
+        if ahocorasick is not None and self._regexes:
+            # A keyword can belong to several keys (e.g. 'poe'), so each word maps to all of them
+            owners = {}
+            for key, keywords in keyword_mapping.items():
+                for order, kw in enumerate(keywords):
+                    owners.setdefault(kw, []).append((key, order))
+            self._automaton = ahocorasick.Automaton()
+            for kw, kw_owners in owners.items():
+                self._automaton.add_word(kw, (kw, tuple(kw_owners)))
+            self._automaton.make_automaton()
+
+    def scan(self, text):
+        """Returns {key: keyword found} for every key with at least one keyword in text."""
+        if not text:
+            return {}
+        if self._automaton is None:
+            found = {}
+            for key, regex in self._regexes.items():
+                match = regex.search(text)
+                if match:
+                    found[key] = match.group(0)
+            return found
+
+        best = {} # key -> (start, keyword order, keyword)
+        for end, (kw, kw_owners) in self._automaton.iter(text):
+            start = end - len(kw) + 1
+            if self.whole_word and (
+                _is_word_char(text, start - 1) == _is_word_char(text, start)
+                or _is_word_char(text, end) == _is_word_char(text, end + 1)
+            ):
+                continue
+            for key, order in kw_owners:
+                candidate = (start, order, kw)
+                if key not in best or candidate < best[key]:
+                    best[key] = candidate
+        return {key: kw for key, (_, _, kw) in best.items()}
+
+
+POWER_KEYWORD_SCANNER = KeywordScanner(config.POWER_KEYWORD_MAPPING, whole_word=True)
+CONNECTIVITY_KEYWORD_SCANNER = KeywordScanner(config.CONNECTIVITY_JSON_TO_PRODUCT_KEYWORDS)
+
+
+def _indicator_from_scan(scanner, texts, columns):
+    """Boolean indicator DataFrame (texts.index x columns) from one scanner pass per text."""
+    rows = [scanner.scan(text) for text in texts]
+    return pd.DataFrame(
+        {column: [column in found for found in rows] for column in columns},
+        index=texts.index, dtype=bool
+    )
+
+
+def connectivity_mask(product_conn_text_lower, conn_id):
+    """Boolean Series: which products' lowercased connectivity text matches a connectivity id.
+
+    Known ids are matched with their compiled keyword alternation in a single str.contains
+    pass; ids outside CONNECTIVITY_JSON_TO_PRODUCT_KEYWORDS are searched for literally.
+    """
+    if conn_id not in config.CONNECTIVITY_JSON_TO_PRODUCT_KEYWORDS:
+        return product_conn_text_lower.str.contains(conn_id, regex=False).astype(bool)
+    conn_regex = CONNECTIVITY_KEYWORD_REGEXES.get(conn_id)
+    if conn_regex is None: # Id has no keywords, never matches
+        return pd.Series(False, index=product_conn_text_lower.index)
+    return product_conn_text_lower.str.contains(conn_regex).astype(bool)
+
+
+def pack_indicator(indicator_df):
+    """Bit-packs a boolean indicator DataFrame column-wise into uint64 words.
+
+    Returns a contiguous (n_columns, ceil(n_products / 64)) array: each word holds the
+    flags of 64 products, so OR-ing columns together touches 1/8 of the bytes of a bool matrix.
+    """
+    packed = np.packbits(indicator_df.to_numpy(dtype=np.uint8).T, axis=1)
+    packed = np.pad(packed, ((0, 0), (0, (-packed.shape[1]) % 8))) # whole uint64 words
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+
+def any_packed(packed, positions, n_products):
+    """Per-product 'any of these columns' over a matrix from pack_indicator, as a bool array."""
+    if len(positions) == 0:
+        return np.zeros(n_products, dtype=bool)
+    words = np.bitwise_or.reduce(packed[positions], axis=0)
+    return np.unpackbits(words.view(np.uint8), count=n_products).astype(bool)
+
+
+def build_indicator_matrices(products_df):
+    """Builds one boolean column per region / connectivity id / power label.
+
+    Matching a request then becomes a column lookup instead of re-scanning the
+    per-row lists and text on every call. Expects a preprocessed products_df.
+    """
+    index = products_df.index
+
+    # Region: one column per region token found in 'Region_Support_List'
+    exploded_regions = products_df['Region_Support_List'].explode().dropna()
+    region_indicator = (
+        pd.get_dummies(exploded_regions, dtype=bool).groupby(level=0).any()
+        .reindex(index, fill_value=False)
+    )
+
+    # Connectivity: substring match of any keyword for each JSON connectivity id
+    product_conn_text_lower = products_df['Connectivity_Lower_Text'].fillna('')
+    if ahocorasick is not None:
+        connectivity_indicator = _indicator_from_scan(
+            CONNECTIVITY_KEYWORD_SCANNER, product_conn_text_lower, config.CONNECTIVITY_JSON_TO_PRODUCT_KEYWORDS
+        )
+    else:
+        connectivity_indicator = pd.DataFrame({
+            conn_id: connectivity_mask(product_conn_text_lower, conn_id)
+            for conn_id in config.CONNECTIVITY_JSON_TO_PRODUCT_KEYWORDS
+        }, index=index)
+
+    # Power: whole-word match of any keyword for each power label in description + notes
+    if 'Description_Notes_Lower_Text' in products_df.columns:
+        product_text_for_power = products_df['Description_Notes_Lower_Text']
+    else:
+        product_text_for_power = (products_df['Description_And_Application'].astype(str) + " " +
+                                  products_df['Notes'].astype(str)).str.lower()
+    if ahocorasick is not None:
+        power_indicator = _indicator_from_scan(
+            POWER_KEYWORD_SCANNER, product_text_for_power, config.POWER_KEYWORD_MAPPING
+        )
+    else:
+        power_indicator = pd.DataFrame({
+            power_label: (product_text_for_power.str.contains(POWER_KEYWORD_REGEXES[power_label]).astype(bool)
+                          if power_label in POWER_KEYWORD_REGEXES else pd.Series(False, index=index))
+            for power_label in config.POWER_KEYWORD_MAPPING
+        }, index=index)
+
+    return {
+        'region': region_indicator,
+        'connectivity': connectivity_indicator,
+        'power': power_indicator,
+        'connectivity_mat': pack_indicator(connectivity_indicator),
+        'power_mat': pack_indicator(power_indicator)
+    }
+
+
+@dataclass(slots=True, frozen=True)
+class ParsedRequirements:
+    """Hard-constraint view of a request, normalized once by HardConstraintMatcher.prepare."""
+    freq_band: str # lowercased, '' if not specified
+    env: str # lowercased, '' if not specified
+    conn_ids: frozenset[str] # lowercased connectivity ids across all 'elaborate' categories
+    power_labels: tuple[str, ...] # as sent by the user, used for lookups and messages
+
+
 class HardConstraintMatcher:
     def __init__(self):
         self.weights = config.WEIGHTS
         self.power_keyword_mapping = config.POWER_KEYWORD_MAPPING
         self.connectivity_json_to_product_keywords = config.CONNECTIVITY_JSON_TO_PRODUCT_KEYWORDS
+        # Built once at import: one pass per text finds every power label / connectivity id
+        self._power_scanner = POWER_KEYWORD_SCANNER
+        self._conn_scanner = CONNECTIVITY_KEYWORD_SCANNER
+
+    def prepare(self, requirements):
+        """Normalizes a ClientRequirements model into a ParsedRequirements, once per request."""
+        elaborate_conn = (requirements.connectivity.elaborate or {}) if requirements.connectivity else {}
+        return ParsedRequirements(
+            freq_band=(requirements.region.frequencyBand or '').lower() if requirements.region else '',
+            env=(requirements.deployment.environment or '').lower() if requirements.deployment else '',
+            conn_ids=frozenset(item.lower() for conn_ids in elaborate_conn.values() for item in conn_ids),
+            power_labels=tuple(requirements.power or ())
+        )
+
+    def check_constraints(self, product_series, requirements):
+        """Checks one product row. requirements is a ParsedRequirements (or a ClientRequirements,
+        which is prepared on the fly; prefer calling prepare once per request)."""
+        if not isinstance(requirements, ParsedRequirements):
+            requirements = self.prepare(requirements)
 
-    def check_constraints(self, product_series, requirements_json):
         constraints_passed_details = {}
         overall_pass = True
         score = 0
         explanation = []
 
         # 1. Frequency Band
-        req_freq_band = requirements_json.get('region', {}).get('frequencyBand', '').lower()
+        req_freq_band = requirements.freq_band
         product_regions = product_series.get('Region_Support_List', [])
         if req_freq_band:
             if req_freq_band in product_regions:
@@ -35,7 +243,7 @@ class HardConstraintMatcher:
 
 
         # 2. Deployment Environment
-        req_env = requirements_json.get('deployment', {}).get('environment', '').lower()
+        req_env = requirements.env
         product_env = product_series.get('Deployment_Environment_Lower', '')
         if req_env:
             matched_env = False
@@ -60,31 +268,24 @@ class HardConstraintMatcher:
 
 
         # 3. Connectivity
-        user_connectivity_reqs_ids = []
-        elaborate_conn = requirements_json.get('connectivity', {}).get('elaborate', {})
-        for conn_category_key, conn_ids in elaborate_conn.items():
-            user_connectivity_reqs_ids.extend([item.lower() for item in conn_ids])
-        user_connectivity_reqs_ids = list(set(user_connectivity_reqs_ids))
+        user_connectivity_reqs_ids = requirements.conn_ids
 
-        matched_conn_options_found = []
         if user_connectivity_reqs_ids:
-            product_conn_text_lower = product_series.get('Connectivity_Lower_Text', '')
+            product_conn_text_lower = product_series.get('Connectivity_Lower_Text', '') or ''
             product_conn_list_lower = product_series.get('Connectivity_List', [])
-            
-            any_user_req_matched = False
-            for req_conn_id in user_connectivity_reqs_ids:
-                keywords_to_check = self.connectivity_json_to_product_keywords.get(req_conn_id, [req_conn_id])
-                req_conn_id_matched_this_product = False
-                for kw in keywords_to_check:
-                    # Check in the pre-split list or the raw text
-                    if kw in product_conn_list_lower or (product_conn_text_lower and kw in product_conn_text_lower):
-                        matched_conn_options_found.append(req_conn_id.upper())
-                        score += self.weights["connectivity_option"]
-                        any_user_req_matched = True
-                        req_conn_id_matched_this_product = True
-                        break # Matched this req_conn_id, move to the next one
-                # logger.debug(f"Product {product_series['Product_ID']} for conn_id {req_conn_id}: checked {keywords_to_check}, matched: {req_conn_id_matched_this_product}")
+            product_conn_ids = product_series.get('Connectivity_Canonical_Set')
+            if product_conn_ids is None: # Row not preprocessed by DataLoader
+                product_conn_ids = frozenset(self._conn_scanner.scan(product_conn_text_lower))
+
+            matched_conn_ids = user_connectivity_reqs_ids & product_conn_ids
+            # Ids outside CONNECTIVITY_JSON_TO_PRODUCT_KEYWORDS: check the id itself in the pre-split list or the raw text
+            for req_conn_id in user_connectivity_reqs_ids - self.connectivity_json_to_product_keywords.keys():
+                if req_conn_id in product_conn_list_lower or req_conn_id in product_conn_text_lower:
+                    matched_conn_ids |= {req_conn_id}
 
+            any_user_req_matched = bool(matched_conn_ids)
+            score += len(matched_conn_ids) * self.weights["connectivity_option"]
+            matched_conn_options_found = [conn_id.upper() for conn_id in matched_conn_ids]
 
             if any_user_req_matched: # At least one of the user's requested connectivities matched
                 constraints_passed_details['connectivity'] = True
@@ -92,31 +293,27 @@ class HardConstraintMatcher:
             else: # User specified connectivities, but NONE of them matched this product
                 constraints_passed_details['connectivity'] = False
                 overall_pass = False
-                explanation.append(f"FAILED connectivity: No product match for user required options: {', '.join(user_connectivity_reqs_ids)}")
+                explanation.append(f"FAILED connectivity: No product match for user required options: {', '.join(sorted(user_connectivity_reqs_ids))}")
         else:
             constraints_passed_details['connectivity'] = None
             explanation.append("Connectivity not specified by user.")
 
 
         # 4. Power
-        req_power_options_labels = requirements_json.get('power', [])
-        product_text_for_power = (str(product_series.get('Description_And_Application', '')) + " " + \
-                                  str(product_series.get('Notes', ''))).lower()
+        req_power_options_labels = requirements.power_labels
+        product_text_for_power = product_series.get('Description_Notes_Lower_Text')
+        if product_text_for_power is None: # Row not preprocessed by DataLoader
+            product_text_for_power = (str(product_series.get('Description_And_Application', '')) + " " + \
+                                      str(product_series.get('Notes', ''))).lower()
         
         power_keywords_found_in_product = []
         if req_power_options_labels:
-            any_power_match = False
+            # One scan of the text finds the first keyword of every power label;
+            # score for power is +1 if *any* requested label matched (handled once below).
+            power_keywords_by_label = self._power_scanner.scan(product_text_for_power)
             for user_power_label in req_power_options_labels:
-                power_keywords_for_label = self.power_keyword_mapping.get(user_power_label, [])
-                for p_keyword in power_keywords_for_label:
-                    if re.search(r'\b' + re.escape(p_keyword) + r'\b', product_text_for_power):
-                        power_keywords_found_in_product.append(f"'{p_keyword}' (for {user_power_label})")
-                        any_power_match = True
-                        # Score for power is +1 if *any* keyword matches, not per keyword.
-                        # So we break after the first keyword for this label, and then the outer loop handles the score once.
-                        break 
-                if any_power_match: # If one keyword for this label matched, we might not need to check other keywords for the same label
-                    pass # continue to next user_power_label, or if we want one score for ANY power match, we can break here too
+                if user_power_label in power_keywords_by_label:
+                    power_keywords_found_in_product.append(f"'{power_keywords_by_label[user_power_label]}' (for {user_power_label})")
 
             if power_keywords_found_in_product: # If list is not empty, at least one keyword matched
                 constraints_passed_details['power'] = True
@@ -130,4 +327,101 @@ class HardConstraintMatcher:
             constraints_passed_details['power'] = None
             explanation.append("Power requirements not specified by user.")
 
-        return overall_pass, score, constraints_passed_details, explanation
\ No newline at end of file
+        return overall_pass, score, constraints_passed_details, explanation
+
+    def check_constraints_batch(self, products_df, requirements, indicators=None):
+        """Vectorized counterpart of check_constraints over a whole products DataFrame.
+
+        Each constraint is a boolean mask from the indicator matrices built by DataLoader
+        (see build_indicator_matrices; built on the fly if not given). Frequency band and
+        environment are applied first; connectivity counting and scans only touch their
+        survivors, so 'hc_score' is only meaningful where 'passed' is True. A constraint the user
+        did not specify is an all-True mask with zero weight, so the pass mask is a single
+        logical AND and the score a single weighted sum. Returns a DataFrame indexed like
+        products_df with 'passed' and 'hc_score' columns. Details and explanations are left
+        to check_constraints, for the few products that are actually returned.
+        """
+        if not isinstance(requirements, ParsedRequirements):
+            requirements = self.prepare(requirements)
+        if indicators is None:
+            indicators = build_indicator_matrices(products_df)
+        region_indicator = indicators['region']
+        connectivity_indicator = indicators['connectivity']
+        power_indicator = indicators['power']
+        connectivity_mat = indicators.get('connectivity_mat')
+        power_mat = indicators.get('power_mat')
+        if connectivity_mat is None or power_mat is None:
+            connectivity_mat = pack_indicator(connectivity_indicator)
+            power_mat = pack_indicator(power_indicator)
+
+        index = products_df.index
+        n_products = len(index)
+        not_specified = np.ones(n_products, dtype=bool)
+
+        # 1. Frequency Band
+        req_freq_band = requirements.freq_band
+        if not req_freq_band:
+            freq_mask = not_specified
+        elif req_freq_band in region_indicator.columns:
+            freq_mask = region_indicator[req_freq_band].to_numpy(dtype=bool)
+        else:
+            freq_mask = np.zeros(n_products, dtype=bool)
+
+        # 2. Deployment Environment
+        req_env = requirements.env
+        if req_env:
+            product_env = products_df['Deployment_Environment_Lower']
+            env_mask = product_env.eq(req_env)
+            if req_env == "both": # if user wants both, product can be indoor, outdoor, both, or even unspecified
+                env_mask |= product_env.isin(["indoor", "outdoor", "both", ""])
+            elif req_env in ["indoor", "outdoor"]: # if product is 'both', it matches specific indoor/outdoor requests
+                env_mask |= product_env.eq("both")
+            env_mask = env_mask.fillna(False).to_numpy(dtype=bool)
+        else:
+            env_mask = not_specified
+
+        # Cheap constraints first: per-product connectivity counts and any connectivity text
+        # scans below only run on the products that survive frequency band + environment.
+        survivors = np.flatnonzero(freq_mask & env_mask)
+
+        # 3. Connectivity
+        user_connectivity_reqs_ids = sorted(requirements.conn_ids)
+        if user_connectivity_reqs_ids:
+            known_conn_ids = [conn_id for conn_id in user_connectivity_reqs_ids if conn_id in connectivity_indicator.columns]
+            # Pass mask: OR of the requested precomputed columns on the packed words
+            conn_mask = any_packed(connectivity_mat, connectivity_indicator.columns.get_indexer(known_conn_ids), n_products)
+            # Score: one weight per matched option
+            conn_count = np.zeros(n_products, dtype=np.int32)
+            conn_count[survivors] = connectivity_indicator.iloc[
+                survivors, connectivity_indicator.columns.get_indexer(known_conn_ids)
+            ].to_numpy(dtype=np.int32).sum(axis=1)
+            unknown_conn_ids = [conn_id for conn_id in user_connectivity_reqs_ids if conn_id not in connectivity_indicator.columns]
+            if unknown_conn_ids:
+                survivor_conn_text_lower = products_df['Connectivity_Lower_Text'].iloc[survivors].fillna('')
+                for req_conn_id in unknown_conn_ids:
+                    # Not precomputed: one str.contains scan with the id's compiled alternation
+                    unknown_mask = np.zeros(n_products, dtype=bool)
+                    unknown_mask[survivors] = connectivity_mask(survivor_conn_text_lower, req_conn_id).to_numpy(dtype=bool)
+                    conn_mask = conn_mask | unknown_mask
+                    conn_count = conn_count + unknown_mask
+        else:
+            conn_mask = not_specified
+            conn_count = np.zeros(n_products, dtype=np.int32)
+
+        # 4. Power
+        req_power_options_labels = requirements.power_labels
+        if req_power_options_labels:
+            known_power_labels = [label for label in req_power_options_labels if label in power_indicator.columns]
+            power_mask = any_packed(power_mat, power_indicator.columns.get_indexer(known_power_labels), n_products)
+        else:
+            power_mask = not_specified
+
+        overall_pass = np.logical_and.reduce([freq_mask, env_mask, conn_mask, power_mask])
+        score = (
+            freq_mask * (self.weights["frequency_band"] if req_freq_band else 0)
+            + env_mask * (self.weights["environment"] if req_env else 0)
+            + conn_count * self.weights["connectivity_option"]
+            + power_mask * (self.weights["power_keyword"] if req_power_options_labels else 0) # Score once if any power option matched
+        ).astype(np.int32)
+
+        return pd.DataFrame({'passed': overall_pass, 'hc_score': score}, index=index)
@@ -1,22 +1,63 @@
 # recommender_system/recommender.py
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 import logging
 from . import config # Use relative import
-from .hard_matcher import HardConstraintMatcher
-from .soft_matcher import SoftMatcher
+from .cache_files import write_cache_file
+from .hard_matcher import HardConstraintMatcher, build_indicator_matrices
+from .soft_matcher import SoftMatcher, quantize_embeddings
+from .schemas import ClientRequirements
+
+try:
+    from numba import njit # Optional: JIT-compiles the final-score kernel
+except ImportError:
+    njit = None
 
 logger = logging.getLogger(__name__)
 
+
+def _final_scores_numpy(hc_scores, sims, scale):
+    """hc_score + similarity * scale for every candidate (float64 arrays)."""
+    return hc_scores + sims * scale
+
+if njit is not None:
+    @njit(cache=True)
+    def _final_scores(hc_scores, sims, scale):
+        out = np.empty_like(hc_scores)
+        for i in range(hc_scores.size):
+            out[i] = hc_scores[i] + sims[i] * scale
+        return out
+else:
+    _final_scores = _final_scores_numpy
+
 class ProductRecommender:
-    def __init__(self, products_df, features_df, product_feature_map_df):
+    def __init__(self, products_df, features_df, product_feature_map_df, indicators=None):
         self.products_df = products_df
         self.features_df = features_df
         self.product_feature_map_df = product_feature_map_df
+        # Cast join keys once (no-op when DataLoader already did) so corpus building can merge on them
+        if features_df is not None and not features_df.empty:
+            features_df['Feature_ID'] = features_df['Feature_ID'].astype(str)
+        if product_feature_map_df is not None and not product_feature_map_df.empty:
+            product_feature_map_df['Product_ID'] = product_feature_map_df['Product_ID'].astype(str)
+            product_feature_map_df['Feature_ID'] = product_feature_map_df['Feature_ID'].astype(str)
+        # Boolean indicator matrices from DataLoader.get_indicators(); built once here if not provided
+        if indicators is None and products_df is not None and not products_df.empty:
+            indicators = build_indicator_matrices(products_df)
+        self.indicators = indicators
         
         self.hard_matcher = HardConstraintMatcher()
         self.soft_matcher = SoftMatcher()
+        # Encodes the requirement query while recommend() runs the hard-constraint filter
+        self._exec = ThreadPoolExecutor(max_workers=config.QUERY_ENCODE_WORKERS, thread_name_prefix='query-encode')
         self.weights = config.WEIGHTS
+        # Compile (or load from numba's cache) the score kernel now, not on this worker's first request
+        _final_scores(np.zeros(1), np.zeros(1), 1.0)
+        self.product_emb_matrix = None # Contiguous 2-D float32 (n_products, dim), row i is products_df.iloc[i]
+        self.product_emb_scale = None # int8 dequantization scale, see soft_matcher.quantize_embeddings
 
         self._precompute_product_data()
 
@@ -26,157 +67,214 @@ class ProductRecommender:
         if self.products_df is None or self.products_df.empty:
             logger.error("Products DataFrame is empty. Cannot precompute.")
             self.products_df['combined_text'] = pd.Series(dtype='str')
-            self.products_df['embedding'] = pd.Series(dtype='object')
             return
 
-        self.products_df['combined_text'] = self.products_df.apply(
-            lambda row: self.soft_matcher.build_product_corpus(row, self.features_df, self.product_feature_map_df),
-            axis=1
+        self.products_df['combined_text'] = self.soft_matcher.build_product_corpora(
+            self.products_df, self.features_df, self.product_feature_map_df
         )
         
         product_corpuses = self.products_df['combined_text'].tolist()
         if not product_corpuses or all(not text for text in product_corpuses):
             logger.warning("All product corpuses are empty. Embeddings will not be generated.")
-            self.products_df['embedding'] = [np.array([]) for _ in range(len(self.products_df))]
         else:
-            embeddings = self.soft_matcher.get_embeddings(product_corpuses)
+            embeddings = self._load_or_encode_product_embeddings(product_corpuses)
             if embeddings is not None and len(embeddings) == len(self.products_df):
-                 # Store embeddings as list of numpy arrays
-                self.products_df['embedding'] = [emb for emb in embeddings]
+                # One contiguous matrix instead of a DataFrame column of per-row arrays
+                # Own copy: may be normalized in place below, and a single-product encode may be a read-only cached array
+                self.product_emb_matrix = np.array(embeddings, dtype=np.float32, order='C')
+                if not config.NORMALIZE_EMBEDDINGS: # Otherwise model.encode already L2-normalized them
+                    # L2-normalize once so query-time cosine similarity is a plain dot product
+                    # Row norms via a fused einsum dot rather than np.linalg.norm
+                    norms = np.sqrt(np.einsum('ij,ij->i', self.product_emb_matrix, self.product_emb_matrix))[:, None]
+                    norms[norms == 0] = 1
+                    self.product_emb_matrix /= norms
+                self.product_emb_matrix, self.product_emb_scale = quantize_embeddings(
+                    self.product_emb_matrix, config.EMBEDDING_QUANTIZATION
+                )
             else:
-                logger.error("Failed to generate or align embeddings for products. Embedding column will be empty.")
-                # Fill with empty arrays to avoid errors later, or handle more gracefully
-                self.products_df['embedding'] = [np.array([]) for _ in range(len(self.products_df))]
+                logger.error("Failed to generate or align embeddings for products. Similarity scores will be 0.")
         
         logger.info("Precomputation of product data (text & embeddings) complete.")
 
+    def _embedding_cache_path(self, product_corpuses):
+        key = hashlib.sha1(
+            (self.soft_matcher.model_name + f"|normalized={config.NORMALIZE_EMBEDDINGS}|" + '\x1f'.join(product_corpuses)).encode('utf-8')
+        ).hexdigest()
+        return os.path.join(config.EMBEDDING_CACHE_DIR, f"embeddings_{key}.npy")
+
+    def _load_or_encode_product_embeddings(self, product_corpuses):
+        """Returns product embeddings as a 2-D float32 array, from the disk cache when the corpora are unchanged."""
+        cache_path = self._embedding_cache_path(product_corpuses) if config.EMBEDDING_CACHE_ENABLED else None
+        if cache_path and os.path.exists(cache_path):
+            try:
+                embeddings = np.load(cache_path)
+                if embeddings.ndim == 2 and embeddings.shape[0] == len(product_corpuses):
+                    logger.info(f"Loaded product embeddings from cache {cache_path}.")
+                    return embeddings
+                logger.warning(f"Ignoring embedding cache {cache_path} with unexpected shape {embeddings.shape}.")
+            except Exception as e:
+                logger.warning(f"Could not read embedding cache, re-encoding: {e}")
 
-    def recommend(self, requirements_json, top_n=5):
+        embeddings = self.soft_matcher.get_embeddings(product_corpuses)
+        if embeddings is None or len(embeddings) != len(product_corpuses):
+            return embeddings
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+
+        if cache_path:
+            def save_embeddings(path):
+                with open(path, 'wb') as f: # np.save(path) would append '.npy' to the temp name
+                    np.save(f, embeddings)
+            try: # A read-only filesystem should not prevent startup
+                write_cache_file(
+                    cache_path, save_embeddings,
+                    stale_glob=os.path.join(config.EMBEDDING_CACHE_DIR, "embeddings_*.npy")
+                )
+                logger.info(f"Product embeddings cached to {cache_path}.")
+            except Exception as e:
+                logger.warning(f"Could not write embedding cache: {e}")
+        return embeddings
+
+
+    def recommend(self, requirements, top_n=5):
+        """Recommends products for a ClientRequirements model (plain dicts are validated into one)."""
         if self.products_df is None or self.products_df.empty:
             logger.warning("No product data available for recommendations.")
             return []
 
-        # 1. Hard Constraint Filtering
-        candidate_products_indices = []
-        hard_constraint_results = []
-
-        for index, product_row in self.products_df.iterrows():
-            passed_all, hc_score, hc_details, hc_explanation = self.hard_matcher.check_constraints(product_row, requirements_json)
-            if passed_all:
-                candidate_products_indices.append(index)
-                hard_constraint_results.append({
-                    'index': index,
-                    'hc_score': hc_score,
-                    'hc_details': hc_details,
-                    'hc_explanation': hc_explanation
-                })
-        
-        if not candidate_products_indices:
+        if not isinstance(requirements, ClientRequirements):
+            requirements = ClientRequirements.model_validate(requirements)
+
+        # Start the query embedding first: it is independent of the hard-constraint pass, and
+        # sentence-transformers releases the GIL in its forward pass, so the two overlap.
+        requirement_query_str = self.soft_matcher.build_requirement_query(requirements)
+        query_embedding_future = None
+        if requirement_query_str.strip() and self.soft_matcher.model is not None:
+            query_embedding_future = self._exec.submit(self.soft_matcher.get_embeddings, [requirement_query_str])
+
+        # 1. Hard Constraint Filtering (vectorized over all products)
+        parsed_requirements = self.hard_matcher.prepare(requirements) # Normalized once per request
+        hc_results_df = self.hard_matcher.check_constraints_batch(
+            self.products_df, parsed_requirements, indicators=self.indicators
+        )
+        # Candidates as positional parallel arrays: no DataFrame copy/join, no per-row pandas access
+        cand_pos = np.flatnonzero(hc_results_df['passed'].to_numpy())
+
+        if cand_pos.size == 0:
             logger.info("No products passed the hard constraints.")
+            if query_embedding_future is not None:
+                # Not needed any more; frees the executor slot if the encode has not started yet
+                query_embedding_future.cancel()
             # Optionally provide feedback on why no products matched
             return []
         
-        candidate_products_df = self.products_df.loc[candidate_products_indices].copy()
-        # Merge hc_results back to candidate_products_df for easy access
-        hc_results_df = pd.DataFrame(hard_constraint_results).set_index('index')
-        candidate_products_df = candidate_products_df.join(hc_results_df)
+        cand_index = self.products_df.index[cand_pos].tolist()
+        cand_product_ids = self.products_df['Product_ID'].to_numpy()[cand_pos].tolist()
+        cand_product_names = self.products_df['Product_Name'].to_numpy()[cand_pos].tolist()
+        cand_hc_scores = hc_results_df['hc_score'].to_numpy()[cand_pos].tolist()
 
-        logger.info(f"{len(candidate_products_df)} products passed hard constraints.")
+        logger.info(f"{cand_pos.size} products passed hard constraints.")
 
         # 2. Soft Matching for candidate products
-        requirement_query_str = self.soft_matcher.build_requirement_query(requirements_json)
         logger.info(f"Requirement query for soft match: '{requirement_query_str}'")
 
         recommendation_data = []
 
-        if not requirement_query_str.strip() or self.soft_matcher.model is None:
+        if query_embedding_future is None:
             logger.warning("Requirement query is empty or soft matcher model not available. Skipping similarity calculation.")
-            for idx, row in candidate_products_df.iterrows():
+            for idx, product_id, product_name, hc_score in zip(cand_index, cand_product_ids, cand_product_names, cand_hc_scores):
                 recommendation_data.append({
-                    'product_id': row['Product_ID'],
-                    'product_name': row['Product_Name'],
-                    'hard_constraint_score': row['hc_score'],
-                    'hard_constraint_details': row['hc_details'],
-                    'hard_constraint_explanation': row['hc_explanation'],
+                    'index': idx,
+                    'product_id': product_id,
+                    'product_name': product_name,
+                    'hard_constraint_score': hc_score,
                     'similarity_score': 0.0,
-                    'final_score': row['hc_score'],
-                    'explanation': row['hc_explanation'] + ["Text Similarity: 0.00 (Query empty or model issue)"]
+                    'final_score': hc_score,
+                    'similarity_explanation': "Text Similarity: 0.00 (Query empty or model issue)"
                 })
         else:
-            query_embedding = self.soft_matcher.get_embeddings([requirement_query_str])
+            query_embedding = query_embedding_future.result()
             if query_embedding is None or query_embedding.shape[0] == 0:
                  logger.error("Failed to generate embedding for the requirement query.")
                  # Handle as if no similarity (similar to empty query string)
-                 for idx, row in candidate_products_df.iterrows():
+                 for idx, product_id, product_name, hc_score in zip(cand_index, cand_product_ids, cand_product_names, cand_hc_scores):
                     recommendation_data.append({
-                        'product_id': row['Product_ID'],
-                        'product_name': row['Product_Name'],
-                        'hard_constraint_score': row['hc_score'],
-                        'hard_constraint_details': row['hc_details'],
-                        'hard_constraint_explanation': row['hc_explanation'],
+                        'index': idx,
+                        'product_id': product_id,
+                        'product_name': product_name,
+                        'hard_constraint_score': hc_score,
                         'similarity_score': 0.0,
-                        'final_score': row['hc_score'],
-                        'explanation': row['hc_explanation'] + ["Text Similarity: 0.00 (Query embedding failed)"]
+                        'final_score': hc_score,
+                        'similarity_explanation': "Text Similarity: 0.00 (Query embedding failed)"
                     })
             else:
                 query_embedding = query_embedding[0] # We only have one query
                 
-                product_embeddings_for_similarity = [
-                    emb for emb in candidate_products_df['embedding'].tolist() if emb is not None and emb.size > 0
-                ]
-                
-                # Keep track of original indices for products with valid embeddings
-                valid_embedding_indices = [
-                    idx for idx, emb in enumerate(candidate_products_df['embedding'].tolist()) if emb is not None and emb.size > 0
-                ]
-
-                if not product_embeddings_for_similarity:
+                if self.product_emb_matrix is None:
                     logger.warning("No valid product embeddings found among candidates for similarity calculation.")
                     cosine_similarities = []
                 else:
-                    cosine_similarities = self.soft_matcher.calculate_similarity(query_embedding, product_embeddings_for_similarity)
-
-                # Map similarities back to the candidate_products_df
-                # Initialize similarity scores to 0 for all candidates
-                candidate_products_df['similarity_score_temp'] = 0.0 
-                for i, sim_score in enumerate(cosine_similarities):
-                    original_candidate_idx = valid_embedding_indices[i]
-                    # Get the actual DataFrame index from the candidate_products_df using its iloc
-                    df_index = candidate_products_df.index[original_candidate_idx]
-                    candidate_products_df.loc[df_index, 'similarity_score_temp'] = sim_score
-
-
-                for idx, row in candidate_products_df.iterrows():
-                    similarity = row.get('similarity_score_temp', 0.0) # Default to 0 if not set
-                    scaled_similarity_score = similarity * self.weights["text_similarity_scale"]
-                    final_score = row['hc_score'] + scaled_similarity_score
-                    
-                    full_explanation = list(row['hc_explanation']) # Make a copy
-                    full_explanation.append(f"Text Similarity Score: {similarity:.2f} (scaled: {scaled_similarity_score:.2f})")
+                    # Candidate submatrix in one fancy-indexing step (matrix rows are products_df positions)
+                    cosine_similarities = self.soft_matcher.calculate_similarity(
+                        query_embedding, self.product_emb_matrix[cand_pos], scale=self.product_emb_scale
+                    )
+
+                # Similarities stay in a plain array aligned with the candidate arrays (0 if not computed);
+                # float64 to match the scores previously read back from a float DataFrame column
+                sims = np.zeros(cand_pos.size, dtype=np.float64)
+                if len(cosine_similarities):
+                    sims[:] = cosine_similarities
 
+                # Numeric work in one kernel; explanation strings are only formatted for the returned top_n
+                final_scores = _final_scores(
+                    np.asarray(cand_hc_scores, dtype=np.float64), sims, float(self.weights["text_similarity_scale"])
+                )
+                for idx, product_id, product_name, hc_score, similarity, similarity_rounded, final_score_rounded in zip(
+                    cand_index, cand_product_ids, cand_product_names, cand_hc_scores,
+                    sims, np.round(sims, 4), np.round(final_scores, 2)
+                ):
                     recommendation_data.append({
-                        'product_id': row['Product_ID'],
-                        'product_name': row['Product_Name'],
-                        'hard_constraint_score': row['hc_score'],
-                        'hard_constraint_details': row['hc_details'],
-                        'similarity_score': round(similarity, 4),
-                        'final_score': round(final_score, 2),
-                        'explanation': full_explanation
+                        'index': idx,
+                        'product_id': product_id,
+                        'product_name': product_name,
+                        'hard_constraint_score': hc_score,
+                        'similarity_score': similarity_rounded,
+                        'final_score': final_score_rounded,
+                        'similarity': similarity,
+                        'similarity_explanation': None # Formatted below, only for returned products
                     })
 
-        # Sort products by final score
-        ranked_products = sorted(recommendation_data, key=lambda x: x['final_score'], reverse=True)
+        # Select the top_n by final score: O(N) partition, then sort only the survivors.
+        # Ties keep candidate order (as a stable sort would), so boundary ties are taken in order.
+        final_scores = np.fromiter(
+            (r['final_score'] for r in recommendation_data), dtype=np.float64, count=len(recommendation_data)
+        )
+        n_ranked = max(min(top_n, len(final_scores)), 0)
+        if n_ranked < len(final_scores):
+            kth_score = np.partition(final_scores, len(final_scores) - n_ranked)[len(final_scores) - n_ranked] \
+                if n_ranked else np.inf
+            top_idx = np.flatnonzero(final_scores >= kth_score)
+        else:
+            top_idx = np.arange(len(final_scores))
+        top_idx = top_idx[np.argsort(-final_scores[top_idx], kind='stable')][:n_ranked]
 
-        # Format output
+        # Format output. Hard-constraint details/explanations are only built for the returned products.
         output_recommendations = []
-        for p_data in ranked_products[:top_n]:
+        for p_data in (recommendation_data[i] for i in top_idx):
+            similarity_explanation = p_data['similarity_explanation']
+            if similarity_explanation is None:
+                similarity = p_data['similarity']
+                scaled_similarity_score = similarity * self.weights["text_similarity_scale"]
+                similarity_explanation = f"Text Similarity Score: {similarity:.2f} (scaled: {scaled_similarity_score:.2f})"
+            _, _, hc_details, hc_explanation = self.hard_matcher.check_constraints(
+                self.products_df.loc[p_data['index']], parsed_requirements
+            )
             output_recommendations.append({
                 "Product_ID": p_data['product_id'],
                 "Product_Name": p_data['product_name'],
-                "Hard_Constraints_Passed_Details": p_data['hard_constraint_details'],
+                "Hard_Constraints_Passed_Details": hc_details,
                 "Text_Similarity": p_data['similarity_score'],
                 "Final_Score": p_data['final_score'],
-                "Explanation_Details": p_data['explanation']
+                "Explanation_Details": hc_explanation + [similarity_explanation]
             })
             
         return output_recommendations
\ No newline at end of file
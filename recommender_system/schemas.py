@@ -0,0 +1,32 @@
+# recommender_system/schemas.py
+from pydantic import BaseModel
+
+# Typed request models. Validated once (by FastAPI or ProductRecommender.recommend) and
+# then read by attribute throughout the matchers. Unknown fields are ignored.
+
+class RegionInfo(BaseModel):
+    selected: str | None = None
+    frequencyBand: str | None = None
+
+class DeploymentInfo(BaseModel):
+    environment: str | None = None
+
+class ApplicationInfo(BaseModel):
+    type: str | None = None
+    subtypes: list[str] | None = None
+    otherSubtype: str | None = None
+
+class ConnectivityInfo(BaseModel):
+    # Category (e.g. 'wirelessCommunication') -> connectivity ids (e.g. ['lorawan', 'lte'])
+    elaborate: dict[str, list[str]] | None = None
+
+class ClientRequirements(BaseModel):
+    clientInfo: dict | None = None # Making these optional as per example JSON
+    region: RegionInfo | None = None
+    deployment: DeploymentInfo | None = None
+    application: ApplicationInfo | None = None
+    scale: str | None = None
+    connectivity: ConnectivityInfo | None = None
+    power: list[str] | None = None
+    additionalDetails: str | None = None
+    # Add any other fields your frontend might send, ensuring types match
@@ -1,5 +1,6 @@
 # recommender_system/soft_matcher.py
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import SentenceTransformer
+import functools
 import numpy as np
 import logging
 from . import config # Use relative import
@@ -8,71 +9,118 @@ import re
 
 logger = logging.getLogger(__name__)
 
+_WS_RE = re.compile(r'\s+')
+
+# Loaded models by name, so the module-level query cache can look them up without holding a SoftMatcher
+_models = {}
+
+@functools.lru_cache(maxsize=1024)
+def _encode_query(model_name, q):
+    """Cached single-text encode; q is already normalized (lowercased, whitespace-collapsed) by the caller."""
+    embedding = _encode(_models[model_name], [q])
+    embedding.setflags(write=False) # Shared between callers via the cache
+    return embedding
+
+def _encode(model, texts):
+    """model.encode with the configured batch size and normalization, as a float32 ndarray."""
+    embeddings = model.encode(
+        texts,
+        batch_size=config.ENCODE_BATCH_SIZE,
+        convert_to_numpy=True,
+        normalize_embeddings=config.NORMALIZE_EMBEDDINGS,
+        show_progress_bar=False
+    )
+    return np.asarray(embeddings, dtype=np.float32)
+
+def quantize_embeddings(matrix, mode):
+    """Returns (matrix, scale) stored at the precision given by config.EMBEDDING_QUANTIZATION.
+
+    scale is only set for 'int8', where float32 scores must be divided by scale.
+    """
+    if mode == 'int8':
+        max_abs = float(np.max(np.abs(matrix))) if matrix.size else 0.0
+        scale = 127 / max_abs if max_abs > 0 else 1.0
+        return np.round(matrix * scale).astype(np.int8), scale
+    if mode == 'fp16':
+        return matrix.astype(np.float16), None
+    if mode is not None:
+        logger.warning(f"Unknown EMBEDDING_QUANTIZATION '{mode}', keeping float32 embeddings.")
+    return matrix, None
+
+def _encode_multi_process(model, texts):
+    """Like _encode, but spread over a SentenceTransformer multi-process pool (one worker per device)."""
+    pool = model.start_multi_process_pool()
+    try:
+        embeddings = model.encode_multi_process(
+            texts, pool, batch_size=config.ENCODE_BATCH_SIZE, normalize_embeddings=config.NORMALIZE_EMBEDDINGS
+        )
+    finally:
+        model.stop_multi_process_pool(pool)
+    return np.asarray(embeddings, dtype=np.float32)
+
+def _cos(a, B):
+    """Cosine similarity of vector a against the rows of pre-normalized matrix B (sqrt(vdot) instead of np.linalg.norm)."""
+    return (B @ a) / np.sqrt(np.vdot(a, a))
+
 class SoftMatcher:
     def __init__(self):
         self.model_name = config.SENTENCE_BERT_MODEL
         try:
             self.model = SentenceTransformer(self.model_name)
+            _models[self.model_name] = self.model
             logger.info(f"SentenceTransformer model '{self.model_name}' loaded successfully.")
         except Exception as e:
             logger.error(f"Failed to load SentenceTransformer model '{self.model_name}': {e}")
             self.model = None # Fallback or raise error
 
-    def build_product_corpus(self, product_row, features_df, product_feature_map_df):
-        if product_row is None: return ""
-        texts = []
-        
-        # Ensure data types are string to avoid issues with .get() on non-dict/Series or float NaNs
-        desc_app = product_row.get('Description_And_Application', '')
-        notes = product_row.get('Notes', '')
-        connectivity = product_row.get('Connectivity', '') # Raw connectivity string
+    def build_product_corpora(self, products_df, features_df, product_feature_map_df):
+        """Corpus text per product (description, notes, connectivity, feature descriptions); returns a Series aligned to the products_df index."""
+        if products_df is None or products_df.empty:
+            return pd.Series(dtype='str')
+
+        def text_column(col):
+            if col not in products_df.columns:
+                return pd.Series('', index=products_df.index)
+            return products_df[col].fillna('').astype(str)
 
-        texts.append(str(desc_app) if pd.notna(desc_app) else '')
-        texts.append(str(notes) if pd.notna(notes) else '')
-        texts.append(str(connectivity) if pd.notna(connectivity) else '')
+        combined = text_column('Description_And_Application').str.cat(
+            [text_column('Notes'), text_column('Connectivity')], sep=' '
+        )
 
-        # Get associated features
+        # Feature descriptions per product, in features_df order
         if features_df is not None and not features_df.empty and \
            product_feature_map_df is not None and not product_feature_map_df.empty:
-            product_id = str(product_row.get('Product_ID', ''))
-            if product_id:
-                associated_feature_ids = product_feature_map_df[
-                    product_feature_map_df['Product_ID'] == product_id
-                ]['Feature_ID']
-                
-                if not associated_feature_ids.empty:
-                    # Ensure Feature_ID in features_df is also string for consistent merging/filtering
-                    features_df['Feature_ID'] = features_df['Feature_ID'].astype(str)
-                    feature_descriptions = features_df[
-                        features_df['Feature_ID'].isin(associated_feature_ids)
-                    ]['Feature_Description']
-                    texts.extend(feature_descriptions.dropna().astype(str).tolist())
-        
-        # Clean up, join, and lowercase
-        full_text = " ".join(filter(None, texts)) # Joins non-empty strings
-        full_text = re.sub(r'\s+', ' ', full_text).strip() # Normalize whitespace
-        return full_text.lower()
+            pairs = product_feature_map_df[['Product_ID', 'Feature_ID']].drop_duplicates()
+            pairs = pairs[pairs['Product_ID'] != '']
+            merged = features_df[['Feature_ID', 'Feature_Description']].dropna(
+                subset=['Feature_Description']
+            ).reset_index(drop=True).reset_index(names='_feature_pos').merge(pairs, on='Feature_ID')
+            merged = merged.sort_values('_feature_pos', kind='stable')
+            feat_text = merged['Feature_Description'].astype(str).groupby(merged['Product_ID'], sort=False).agg(' '.join)
+            product_ids = products_df['Product_ID'].astype(str)
+            combined = combined.str.cat(product_ids.map(feat_text).fillna(''), sep=' ')
+
+        # Clean up and lowercase in one pass
+        return combined.str.replace(_WS_RE, ' ', regex=True).str.strip().str.lower()
 
 
-    def build_requirement_query(self, requirements_json):
+    def build_requirement_query(self, requirements):
         query_parts = []
         
-        app_info = requirements_json.get('application', {})
-        query_parts.append(str(app_info.get('type', '')))
-        
-        subtypes = app_info.get('subtypes', [])
-        if subtypes:
-            query_parts.append(" ".join(subtypes))
-        
-        other_subtype = app_info.get('otherSubtype', '')
-        if other_subtype:
-            query_parts.append(other_subtype)
+        app_info = requirements.application
+        if app_info:
+            query_parts.append(app_info.type or '')
+            
+            if app_info.subtypes:
+                query_parts.append(" ".join(app_info.subtypes))
             
-        query_parts.append(str(requirements_json.get('additionalDetails', '')))
+            if app_info.otherSubtype:
+                query_parts.append(app_info.otherSubtype)
+            
+        query_parts.append(requirements.additionalDetails or '')
         
         full_query = " ".join(filter(None, query_parts))
-        full_query = re.sub(r'\s+', ' ', full_query).strip()
-        return full_query.lower()
+        return _WS_RE.sub(' ', full_query).strip().lower()
 
     def get_embeddings(self, texts: list):
         if not self.model:
@@ -83,32 +131,46 @@ class SoftMatcher:
             return [] # Return empty list or handle as appropriate
         
         try:
-            embeddings = self.model.encode(texts, convert_to_tensor=False, show_progress_bar=False)
+            if len(texts) == 1: # Requirement queries repeat; skip the forward pass on a cache hit
+                return _encode_query(self.model_name, texts[0])
+            if len(texts) > config.MULTIPROCESS_THRESHOLD: # Large catalogs: worker startup pays for itself
+                try:
+                    return _encode_multi_process(self.model, texts)
+                except Exception as e:
+                    logger.warning(f"Multi-process encoding failed, falling back to a single process: {e}")
+            embeddings = _encode(self.model, texts)
             return embeddings
         except Exception as e:
             logger.error(f"Error during embedding generation: {e}")
             return None
 
-    def calculate_similarity(self, query_embedding, product_embeddings_list):
-        if query_embedding is None or not product_embeddings_list:
+    def calculate_similarity(self, query_embedding, product_embeddings_matrix, scale=None):
+        """Cosine similarity of the query against L2-normalized product embeddings (rows of a 2-D matrix).
+
+        The matrix may be float32, float16, or int8 from quantize_embeddings; int8 needs its scale.
+        """
+        if query_embedding is None or product_embeddings_matrix is None or len(product_embeddings_matrix) == 0:
             return np.array([]) # Return empty array if no query or product embeddings
         
-        # Ensure product_embeddings_list is a 2D numpy array for util.cos_sim
-        # It might be a list of 1D arrays from precomputation
-        product_embeddings_matrix = np.array([emb for emb in product_embeddings_list if emb is not None and emb.ndim > 0])
+        # Expects a 2-D (n, dim) matrix, e.g. a row slice of ProductRecommender.product_emb_matrix
+        product_embeddings_matrix = np.asarray(product_embeddings_matrix)
         
-        if product_embeddings_matrix.ndim == 1 : # if only one product embedding was valid
+        if product_embeddings_matrix.ndim == 1 : # if only one product embedding was passed
              product_embeddings_matrix = product_embeddings_matrix.reshape(1, -1)
 
         if product_embeddings_matrix.shape[0] == 0: # No valid product embeddings
             return np.array([])
 
-        try:
-            # util.cos_sim expects tensors or numpy arrays.
-            # query_embedding is 1D, product_embeddings_matrix is 2D
-            # The result will be a 2D tensor/array of shape (1, num_product_embeddings)
-            similarities = util.pytorch_cos_sim(query_embedding, product_embeddings_matrix)
-            return similarities.cpu().numpy().flatten() # Get as 1D numpy array
-        except Exception as e:
-            logger.error(f"Error calculating cosine similarity: {e}")
-            return np.array([])
\ No newline at end of file
+        # Product rows are pre-normalized, so cosine similarity reduces to a single
+        # matrix-vector product (BLAS SGEMV) on NumPy arrays; no torch tensors involved.
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        if not query.any(): # Zero vector has no direction; score 0 like cos_sim's eps clamp
+            return np.zeros(product_embeddings_matrix.shape[0], dtype=np.float32)
+        if product_embeddings_matrix.dtype != np.float32:
+            # int8/fp16 storage only saves resident memory: NumPy has no BLAS path for those
+            # dtypes, so widen the candidate slice to float32 and dequantize (int8) after SGEMV.
+            scores = _cos(query, product_embeddings_matrix.astype(np.float32))
+            return scores / scale if product_embeddings_matrix.dtype == np.int8 else scores
+        if config.NORMALIZE_EMBEDDINGS: # get_embeddings already returned a unit query
+            return product_embeddings_matrix @ query
+        return _cos(query, product_embeddings_matrix) # 1D array, one score per product
\ No newline at end of file